@@ -0,0 +1,389 @@
+import os
+import json
+import queue
+import threading
+import urllib.request
+import urllib.error
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from generate_self_play_data import aggregate_samples
+from solver import GomokuSolver
+
+
+class ServerBusy(Exception):
+    """Raised when the analysis queue stays full for longer than the queue timeout."""
+
+
+class InvalidRequest(ValueError):
+    """Raised when a request is malformed and must not reach an engine."""
+
+
+def validate_position(board_state, samples, board_size=15, max_samples=64):
+    """
+    Check a position request before it is sent to an engine.
+
+    Args:
+        board_state (list): List of [x, y, player] moves
+        samples (int): Requested number of engine queries
+        board_size (int): Board size the engines were started with
+        max_samples (int): Largest number of engine queries allowed per request
+
+    Returns:
+        list: board_state as a list of (x, y, player) tuples
+
+    Raises:
+        InvalidRequest: If any move or the sample count is invalid
+    """
+    if not isinstance(samples, int) or isinstance(samples, bool) or not 1 <= samples <= max_samples:
+        raise InvalidRequest(f"samples must be an integer in [1, {max_samples}]")
+    if not isinstance(board_state, list):
+        raise InvalidRequest("board_state must be a list of [x, y, player] moves")
+
+    moves = []
+    occupied = set()
+    for move in board_state:
+        if (not isinstance(move, (list, tuple)) or len(move) != 3
+                or not all(isinstance(v, int) and not isinstance(v, bool) for v in move)):
+            raise InvalidRequest(f"move {move!r} is not [x, y, player] with integer values")
+        x, y, player = move
+        if not (0 <= x < board_size and 0 <= y < board_size):
+            raise InvalidRequest(f"move {move!r} is off the {board_size}x{board_size} board")
+        if player not in (1, 2):
+            raise InvalidRequest(f"move {move!r} has player {player}, expected 1 or 2")
+        if (x, y) in occupied:
+            raise InvalidRequest(f"cell ({x}, {y}) is occupied more than once")
+        occupied.add((x, y))
+        moves.append((x, y, player))
+    return moves
+
+
+def _position_key(board_state, samples):
+    # Stone order does not matter to the engine
+    return (tuple(sorted(tuple(move) for move in board_state)), samples)
+
+
+def _format_result(sample_result):
+    majority_move, avg_score_eval, avg_mate_eval, move_counts = sample_result
+    total_votes = sum(move_data["count"] for move_data in move_counts.values())
+    return {
+        "best_move": list(majority_move["move"]),
+        "score_evaluation": avg_score_eval,
+        "mate_evaluation": avg_mate_eval,
+        "confidence": majority_move["count"] / total_votes,
+        "candidate_moves": {
+            move_key: {"count": move_data["count"], "evaluations": move_data["evaluations"]}
+            for move_key, move_data in move_counts.items()
+        },
+    }
+
+
+class AnalysisService:
+    """
+    Warm pool of GomokuSolver engines with request coalescing and an LRU cache.
+
+    Identical positions requested while one is already being analyzed share
+    the same result. The samples of one analysis are spread over the engines
+    that are idle when it starts, so a lightly loaded server answers in about
+    one turn time; under load each analysis gets fewer engines. At most
+    max_pending distinct analyses are queued or running; further requests
+    wait up to queue_timeout_s and then fail with ServerBusy.
+    """
+
+    def __init__(self, engine_path, num_engines=4, cache_size=10000, max_pending=256, queue_timeout_s=30.0, max_memory_mb=50, timeout_match_ms=180000, timeout_turn_ms=5000, max_samples=64):
+        self.engine_path = engine_path
+        self.engine_kwargs = {
+            "max_memory_mb": max_memory_mb,
+            "timeout_match_ms": timeout_match_ms,
+            "timeout_turn_ms": timeout_turn_ms,
+        }
+        self.max_samples = max_samples
+        self.engines = queue.Queue()
+        self.num_engines = num_engines
+        for _ in range(num_engines):
+            self.engines.put(self._new_engine())
+        self.executor = ThreadPoolExecutor(max_workers=num_engines)
+        # Runs the samples handed to extra engines; separate from executor so
+        # an analysis never waits on a worker held by another analysis
+        self.sample_executor = ThreadPoolExecutor(max_workers=num_engines)
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.inflight = {}
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.queue_timeout_s = queue_timeout_s
+        self.stats = {
+            "requests": 0,
+            "cache_hits": 0,
+            "coalesced": 0,
+            "analyzed": 0,
+            "rejected": 0,
+            "errors": 0,
+            "engine_restarts": 0,
+        }
+
+    def _new_engine(self):
+        return GomokuSolver(self.engine_path, **self.engine_kwargs)
+
+    def _query(self, solver, board_state, num_samples):
+        """Run num_samples engine queries on solver, then return it (or its replacement) to the pool."""
+        try:
+            # A None slot is an engine that failed to restart; retry it here
+            if solver is None:
+                solver = self._new_engine()
+            return [solver.get_best_move(board_state)[0] for _ in range(num_samples)]
+        except Exception:
+            # The engine may be stopped halfway through the protocol; never reuse it
+            if solver is not None:
+                solver.close()
+            with self.lock:
+                self.stats["engine_restarts"] += 1
+            try:
+                solver = self._new_engine()
+            except Exception:
+                solver = None
+            raise
+        finally:
+            self.engines.put(solver)
+
+    def _analyze(self, board_state, samples):
+        solvers = [self.engines.get()]
+        # Idle engines share the samples so a request does not take samples x the turn time
+        while len(solvers) < samples:
+            try:
+                solvers.append(self.engines.get_nowait())
+            except queue.Empty:
+                break
+        shares = [samples // len(solvers) + (1 if i < samples % len(solvers) else 0) for i in range(len(solvers))]
+        helpers = [
+            self.sample_executor.submit(self._query, solver, board_state, num_samples)
+            for solver, num_samples in zip(solvers[1:], shares[1:])
+        ]
+        responses = self._query(solvers[0], board_state, shares[0])
+        for helper in helpers:
+            responses.extend(helper.result())
+        return _format_result(aggregate_samples(responses))
+
+    def _finish(self, key, future):
+        with self.lock:
+            del self.inflight[key]
+            if future.exception() is None:
+                self.stats["analyzed"] += 1
+                self.cache[key] = future.result()
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            else:
+                self.stats["errors"] += 1
+        self.slots.release()
+
+    def submit(self, board_state, samples=1):
+        """
+        Request analysis of a position.
+
+        Args:
+            board_state (list): List of (x, y, player) tuples, player 1 to move
+            samples (int): Number of engine queries aggregated into the result
+
+        Returns:
+            Future: Resolves to a result dictionary with best_move, evaluations,
+                confidence and candidate_moves
+
+        Raises:
+            InvalidRequest: If the position or sample count is invalid
+            ServerBusy: If no queue slot frees up within queue_timeout_s
+        """
+        board_state = validate_position(board_state, samples, max_samples=self.max_samples)
+        key = _position_key(board_state, samples)
+        with self.lock:
+            self.stats["requests"] += 1
+            if key in self.cache:
+                self.stats["cache_hits"] += 1
+                self.cache.move_to_end(key)
+                future = Future()
+                future.set_result(self.cache[key])
+                return future
+            if key in self.inflight:
+                self.stats["coalesced"] += 1
+                return self.inflight[key]
+
+        if not self.slots.acquire(timeout=self.queue_timeout_s):
+            with self.lock:
+                self.stats["rejected"] += 1
+            raise ServerBusy(f"analysis queue full for {self.queue_timeout_s}s")
+
+        with self.lock:
+            # Another request may have started the same analysis while we waited
+            if key in self.inflight:
+                self.stats["coalesced"] += 1
+                self.slots.release()
+                return self.inflight[key]
+            future = self.executor.submit(self._analyze, board_state, samples)
+            self.inflight[key] = future
+        future.add_done_callback(lambda f: self._finish(key, f))
+        return future
+
+    def best_move(self, board_state, samples=1):
+        return self.submit(board_state, samples).result()
+
+    def analyze_batch(self, board_states, samples=1):
+        if not isinstance(board_states, list):
+            raise InvalidRequest("board_states must be a list of positions")
+        # Reject the whole batch before any position reaches an engine
+        for board_state in board_states:
+            validate_position(board_state, samples, max_samples=self.max_samples)
+        futures = [self.submit(board_state, samples) for board_state in board_states]
+        return [future.result() for future in futures]
+
+    def get_stats(self):
+        with self.lock:
+            return dict(
+                self.stats,
+                inflight=len(self.inflight),
+                cache_entries=len(self.cache),
+                idle_engines=self.engines.qsize(),
+                num_engines=self.num_engines,
+            )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.sample_executor.shutdown(wait=True)
+        while not self.engines.empty():
+            solver = self.engines.get()
+            if solver is not None:
+                solver.close()
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP:
+        POST /best_move {"board_state": [[x, y, player], ...], "samples": 1}
+        POST /analyze   {"board_states": [[[x, y, player], ...], ...], "samples": 1}
+        GET  /stats
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.service.get_stats())
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            samples = request.get("samples", 1)
+            if self.path == "/best_move":
+                self._send_json(200, service.best_move(request["board_state"], samples))
+            elif self.path == "/analyze":
+                self._send_json(200, {"results": service.analyze_batch(request["board_states"], samples)})
+            else:
+                self._send_json(404, {"error": f"unknown path {self.path}"})
+        except ServerBusy as e:
+            self._send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+        except InvalidRequest as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            self._send_json(400, {"error": f"bad request: {e!r}"})
+        except Exception as e:
+            self._send_json(500, {"error": f"analysis failed: {e!r}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(engine_path, host="127.0.0.1", port=8765, **service_kwargs):
+    """
+    Run the analysis server until interrupted.
+
+    Args:
+        engine_path (str): Path to the engine executable
+        host (str): Interface to bind, localhost by default
+        port (int): TCP port
+        **service_kwargs: Passed to AnalysisService
+    """
+    service = AnalysisService(engine_path, **service_kwargs)
+    server = ThreadingHTTPServer((host, port), AnalysisRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    print(f"Analysis server with {service.num_engines} engines listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+class AnalysisClient:
+    """Client for a running analysis server."""
+
+    def __init__(self, url="http://127.0.0.1:8765", timeout_s=600):
+        self.url = url.rstrip("/")
+        self.timeout_s = timeout_s
+
+    def _request(self, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout_s) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 503:
+                raise ServerBusy(json.loads(e.read()).get("error")) from e
+            raise
+
+    def best_move(self, board_state, samples=1):
+        result = self._request("/best_move", {"board_state": board_state, "samples": samples})
+        result["best_move"] = tuple(result["best_move"])
+        return result
+
+    def analyze(self, board_states, samples=1):
+        results = self._request("/analyze", {"board_states": board_states, "samples": samples})["results"]
+        for result in results:
+            result["best_move"] = tuple(result["best_move"])
+        return results
+
+    def stats(self):
+        return self._request("/stats")
+
+
+if __name__ == "__main__":
+    engine_path = os.path.join("engines", "EMBRYO21.E", "pbrain-embryo21_e.exe")
+
+    settings = {
+        "host": "127.0.0.1",
+        "port": 8765,
+        "num_engines": 8,
+        "cache_size": 100000,
+        "max_pending": 1024,  # Distinct analyses queued or running before new requests wait
+        "queue_timeout_s": 30.0,  # Requests waiting longer than this get HTTP 503
+        "max_memory_mb": 80,
+        "timeout_turn_ms": 5000,
+    }
+
+    serve(
+        engine_path,
+        host=settings["host"],
+        port=settings["port"],
+        num_engines=settings["num_engines"],
+        cache_size=settings["cache_size"],
+        max_pending=settings["max_pending"],
+        queue_timeout_s=settings["queue_timeout_s"],
+        max_memory_mb=settings["max_memory_mb"],
+        timeout_turn_ms=settings["timeout_turn_ms"],
+    )
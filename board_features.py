@@ -0,0 +1,239 @@
+import numpy as np
+
+BOARD_SIZE = 15
+
+# Line directions as (dy, dx) on a board indexed board[y][x]
+DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+TACTICAL_CATEGORIES = ["terminal", "win_now", "must_block", "open_three", "quiet"]
+
+
+def board_states_to_arrays(board_states, board_size=BOARD_SIZE):
+    """
+    Convert a list of board states to a stacked (N, board_size, board_size) array.
+
+    Args:
+        board_states (list): List of board states, each a list of (x, y, player) tuples
+
+    Returns:
+        np.ndarray: int8 array where boards[i, y, x] is 0 (empty), 1 or 2
+    """
+    boards = np.zeros((len(board_states), board_size, board_size), dtype=np.int8)
+    for i, board_state in enumerate(board_states):
+        for x, y, player in board_state:
+            boards[i, y, x] = player
+    return boards
+
+
+def _line_windows(mask, length, direction):
+    """
+    Return the `length` shifted views of `mask` that make up every window of
+    `length` consecutive cells in the given direction.
+
+    Summing the views gives the same result as convolving each board with the
+    direction kernel of ones, without materializing any intermediate copies.
+
+    Args:
+        mask (np.ndarray): (N, H, W) array
+        length (int): Window length
+        direction (tuple): (dy, dx), one of DIRECTIONS
+
+    Returns:
+        list: `length` arrays of identical shape, one per cell of the window
+    """
+    dy, dx = direction
+    height, width = mask.shape[1], mask.shape[2]
+    n_rows = height - (length - 1) * abs(dy)
+    n_cols = width - (length - 1) * abs(dx)
+    views = []
+    for k in range(length):
+        row = k * dy
+        col = k * dx if dx >= 0 else (length - 1) + k * dx
+        views.append(mask[:, row:row + n_rows, col:col + n_cols])
+    return views
+
+
+def _count_windows(windows):
+    """Count the True cells of each board across a list of (N, ...) window masks."""
+    return sum(w.reshape(w.shape[0], -1).sum(axis=1, dtype=np.int32) for w in windows)
+
+
+def _analyze_chunk(boards):
+    n = boards.shape[0]
+    empty = boards == 0
+    winner = np.zeros(n, dtype=np.int8)
+    fours = np.zeros((n, 2), dtype=np.int32)
+    open_threes = np.zeros((n, 2), dtype=np.int32)
+
+    for side, player in enumerate((1, 2)):
+        own_mask = boards == player
+        own = own_mask.astype(np.int8)
+        opponent = (boards == 3 - player).astype(np.int8)
+
+        fives = []
+        four_windows = []
+        three_windows = []
+        # Adjacent windows holding the same stones, counted so each threat is
+        # reported once: .XXXX. holds one four in two windows of five, and
+        # ..XXX.. holds one open three in two windows of six
+        duplicate_fours = []
+        duplicate_threes = []
+        for direction in DIRECTIONS:
+            # Windows of five: a full window is a win, four stones plus an empty
+            # cell is a four (one move from five)
+            own_5 = sum(_line_windows(own, 5, direction))
+            opp_5 = sum(_line_windows(opponent, 5, direction))
+            fives.append(own_5 == 5)
+            four = (own_5 == 4) & (opp_5 == 0)
+            four_windows.append(four)
+            # Stones that belong to a four in this direction, marked by writing
+            # each four window back through the views of its cells
+            in_four = np.zeros(own.shape, dtype=bool)
+            for cell_view in _line_windows(in_four, 5, direction):
+                cell_view |= four
+            in_four &= own_mask
+
+            # Windows of six with both ends empty and three stones plus one
+            # empty cell inside: .XXX.. / .XX.X. / .X.XX. / ..XXX.
+            own_views = _line_windows(own, 6, direction)
+            empty_views = _line_windows(empty, 6, direction)
+            inner_own = sum(own_views[1:5])
+            inner_empty = sum(v.astype(np.int8) for v in empty_views[1:5])
+            # A three whose stones all belong to a four (..XXX.X) is that four, not
+            # another threat
+            in_four_views = _line_windows(in_four, 6, direction)
+            inner_in_four = sum(v.astype(np.int8) for v in in_four_views[1:5])
+            three_windows.append(
+                empty_views[0] & empty_views[5] & (inner_own == 3) & (inner_empty == 1) & (inner_in_four < 3)
+            )
+
+            duplicate_fours.append(empty_views[0] & empty_views[5] & (inner_own == 4))
+            empty_views_7 = _line_windows(empty, 7, direction)
+            own_views_7 = _line_windows(own, 7, direction)
+            duplicate_threes.append(
+                empty_views_7[0] & empty_views_7[1] & empty_views_7[5] & empty_views_7[6]
+                & (sum(own_views_7[2:5]) == 3)
+            )
+
+        has_five = _count_windows(fives) > 0
+        # A board with fives for both sides is not reachable; report the first
+        winner[has_five & (winner == 0)] = player
+        fours[:, side] = _count_windows(four_windows) - _count_windows(duplicate_fours)
+        open_threes[:, side] = _count_windows(three_windows) - _count_windows(duplicate_threes)
+
+    return winner, fours, open_threes
+
+
+def analyze_positions(boards, best_moves=None, chunk_size=65536):
+    """
+    Compute terminal and threat features for a batch of boards.
+
+    Features are computed with sliding-window sums along the four line
+    directions, so millions of positions are handled in vectorized chunks
+    instead of per-board Python loops.
+
+    Args:
+        boards (np.ndarray): (N, 15, 15) array of 0 (empty), 1 and 2
+        best_moves (array-like): Optional (N, 2) array of labeled (x, y) moves
+        chunk_size (int): Number of boards processed per vectorized chunk
+
+    Returns:
+        dict: Feature arrays keyed by name
+            "winner": (N,) int8, 1 or 2 if that player has five in a row, 0 otherwise
+            "fours": (N, 2) int32, distinct fours (four stones in a window of five
+                with the fifth cell empty) for player 1 and player 2; an open four
+                .XXXX. counts once
+            "open_threes": (N, 2) int32, distinct open threes (.XXX.., .XX.X., ...)
+                for player 1 and player 2; ..XXX.. counts once, and three stones
+                that are part of a four (..XXX.X) count only as that four
+            "label_legal": (N,) bool, only if best_moves is given; True if the move
+                is on the board and on an empty cell
+    """
+    boards = np.asarray(boards)
+    if boards.ndim == 2:
+        boards = boards[np.newaxis]
+    n = boards.shape[0]
+
+    winner = np.zeros(n, dtype=np.int8)
+    fours = np.zeros((n, 2), dtype=np.int32)
+    open_threes = np.zeros((n, 2), dtype=np.int32)
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        winner[start:end], fours[start:end], open_threes[start:end] = _analyze_chunk(boards[start:end])
+
+    features = {
+        "winner": winner,
+        "fours": fours,
+        "open_threes": open_threes,
+    }
+
+    if best_moves is not None:
+        moves = np.asarray(best_moves, dtype=np.int64).reshape(n, 2)
+        xs, ys = moves[:, 0], moves[:, 1]
+        in_bounds = (xs >= 0) & (xs < boards.shape[2]) & (ys >= 0) & (ys < boards.shape[1])
+        label_legal = np.zeros(n, dtype=bool)
+        idx = np.nonzero(in_bounds)[0]
+        label_legal[idx] = boards[idx, ys[idx], xs[idx]] == 0
+        features["label_legal"] = label_legal
+
+    return features
+
+
+def tactical_categories(features):
+    """
+    Assign each position a tactical category from its features.
+
+    The side to move is always player 1 (own stones), matching the convention
+    used by the engine and the generated data.
+
+    Args:
+        features (dict): Output of analyze_positions
+
+    Returns:
+        np.ndarray: (N,) array of category names from TACTICAL_CATEGORIES
+    """
+    winner = features["winner"]
+    fours = features["fours"]
+    open_threes = features["open_threes"]
+
+    categories = np.full(winner.shape[0], "quiet", dtype=object)
+    # Assign from lowest to highest priority so the most urgent category wins
+    categories[(open_threes[:, 0] > 0) | (open_threes[:, 1] > 0)] = "open_three"
+    categories[fours[:, 1] > 0] = "must_block"
+    categories[fours[:, 0] > 0] = "win_now"
+    categories[winner != 0] = "terminal"
+    return categories
+
+
+def stratified_sample(categories, samples_per_category, seed=0):
+    """
+    Pick up to `samples_per_category` indices from each tactical category.
+
+    Args:
+        categories (np.ndarray): (N,) category names, as from tactical_categories
+        samples_per_category (int or dict): Sample size for every category, or a
+            dictionary mapping category name to sample size (missing categories
+            are not sampled)
+        seed (int): Random seed
+
+    Returns:
+        np.ndarray: Sorted indices of the sampled positions
+    """
+    rng = np.random.default_rng(seed)
+    categories = np.asarray(categories)
+    selected = []
+    for category in TACTICAL_CATEGORIES:
+        if isinstance(samples_per_category, dict):
+            k = samples_per_category.get(category, 0)
+        else:
+            k = samples_per_category
+        idx = np.nonzero(categories == category)[0]
+        if k <= 0 or len(idx) == 0:
+            continue
+        if len(idx) > k:
+            idx = rng.choice(idx, size=k, replace=False)
+        selected.append(idx)
+
+    if not selected:
+        return np.zeros(0, dtype=np.int64)
+    return np.sort(np.concatenate(selected))
@@ -1,8 +1,11 @@
+import os
 import csv
 import json
 import numpy as np
 import ast
 from tqdm import tqdm
+from board_features import analyze_positions, tactical_categories, stratified_sample
+from position_index import PositionIndex, canonical_hashes
 
 def board_state_to_array(board_state):
     """Convert a board state string to a 15x15 numpy array."""
@@ -45,13 +48,14 @@ def get_isomorphisms(board, move):
     # Rotations (90, 180, 270 degrees)
     for k in range(1, 4):
         rotated_board = np.rot90(board, k=k)
-        # For a 15x15 board, the new coordinates after rotation
+        # For a 15x15 board, the new coordinates after np.rot90 (counterclockwise
+        # as displayed, board indexed board[y][x])
         if k == 1:  # 90 degrees
-            new_x, new_y = 14-y, x
+            new_x, new_y = y, 14-x
         elif k == 2:  # 180 degrees
             new_x, new_y = 14-x, 14-y
         else:  # 270 degrees
-            new_x, new_y = y, 14-x
+            new_x, new_y = 14-y, x
         
         isomorphisms.append((rotated_board.copy(), (new_x, new_y)))
     
@@ -63,11 +67,11 @@ def get_isomorphisms(board, move):
     for k in range(1, 4):
         rotated_flipped_board = np.rot90(flipped_board, k=k)
         if k == 1:
-            new_x, new_y = 14-flipped_y, flipped_x
+            new_x, new_y = flipped_y, 14-flipped_x
         elif k == 2:
             new_x, new_y = 14-flipped_x, 14-flipped_y
         else:
-            new_x, new_y = flipped_y, 14-flipped_x
+            new_x, new_y = 14-flipped_y, flipped_x
         
         isomorphisms.append((rotated_flipped_board.copy(), (new_x, new_y)))
     
@@ -77,13 +81,68 @@ def board_to_hash(board):
     """Convert a board array to a string representation for hashing."""
     return ''.join(str(int(cell)) for cell in board.flatten())
 
-def filter_positions(input_file, confidence_threshold=8):
+def parse_confident_row(row, confidence_threshold=8):
+    """
+    Parse a TSV row, keeping it only if its best move has high confidence.
+    
+    Args:
+        row: List of TSV fields (board_state, best_move, score, mate, candidate_moves)
+        confidence_threshold: Only keep moves with this count or higher
+        
+    Returns:
+        Tuple (board_array, best_move), or None if the row is not confident enough
+    """
+    board_state_str = row[0]
+    best_move_str = row[1]
+    candidate_moves_str = row[4]
+    
+    # Parse the best move
+    best_move = ast.literal_eval(best_move_str)
+    
+    # Parse candidate moves to check confidence
+    candidate_moves = ast.literal_eval(candidate_moves_str)
+    best_move_key = str(best_move)
+    
+    # Only keep positions where the best move has high confidence
+    if best_move_key in candidate_moves and candidate_moves[best_move_key]["count"] >= confidence_threshold:
+        # Convert board state to array
+        return board_state_to_array(board_state_str), best_move
+    return None
+
+def apply_tactical_filters(positions, drop_terminal=False, drop_illegal_labels=False):
+    """
+    Drop terminal or illegally labeled positions in one batched pass.
+    
+    Args:
+        positions: List of tuples (board_array, best_move)
+        drop_terminal: Drop positions where a player already has five in a row
+        drop_illegal_labels: Drop positions whose best move is on an occupied cell
+        
+    Returns:
+        positions: List of tuples (board_array, best_move) that pass the filters
+    """
+    if not positions or not (drop_terminal or drop_illegal_labels):
+        return positions
+    
+    boards = np.stack([board for board, _ in positions])
+    best_moves = np.array([best_move for _, best_move in positions])
+    features = analyze_positions(boards, best_moves)
+    keep = np.ones(len(positions), dtype=bool)
+    if drop_terminal:
+        keep &= features["winner"] == 0
+    if drop_illegal_labels:
+        keep &= features["label_legal"]
+    return [position for position, k in zip(positions, keep) if k]
+
+def filter_positions(input_file, confidence_threshold=8, drop_terminal=False, drop_illegal_labels=False):
     """
     Filter positions based on confidence and isomorphism.
     
     Args:
         input_file: Path to the input TSV file
         confidence_threshold: Only keep moves with this count or higher
+        drop_terminal: Drop positions where a player already has five in a row
+        drop_illegal_labels: Drop positions whose best move is on an occupied cell
         
     Returns:
         filtered_positions: List of tuples (board_array, best_move)
@@ -91,11 +150,13 @@ def filter_positions(input_file, confidence_threshold=8):
     """
     filtered_positions = []
     seen_positions = set()
+    confident_positions = []
     
     # Statistics counters
     stats = {
         "total_positions": 0,
         "positions_after_confidence_filter": 0,
+        "positions_after_tactical_filter": 0,
         "positions_after_isomorphism_filter": 0
     }
     
@@ -108,46 +169,65 @@ def filter_positions(input_file, confidence_threshold=8):
         stats["total_positions"] = len(rows)
         
         for row in tqdm(rows, desc="Filtering positions"):
-            board_state_str = row[0]
-            best_move_str = row[1]
-            candidate_moves_str = row[4]
-            
-            # Parse the best move
-            best_move = ast.literal_eval(best_move_str)
+            position = parse_confident_row(row, confidence_threshold)
+            if position is not None:
+                stats["positions_after_confidence_filter"] += 1
+                confident_positions.append(position)
+    
+    confident_positions = apply_tactical_filters(confident_positions, drop_terminal, drop_illegal_labels)
+    stats["positions_after_tactical_filter"] = len(confident_positions)
+    
+    for board, best_move in tqdm(confident_positions, desc="Removing isomorphic positions"):
+        # Generate all isomorphic versions
+        isomorphisms = get_isomorphisms(board, best_move)
+        
+        # Check if we've seen any isomorphic version of this position
+        is_new_position = True
+        for iso_board, _ in isomorphisms:
+            board_hash = board_to_hash(iso_board)
+            if board_hash in seen_positions:
+                is_new_position = False
+                break
+        
+        if is_new_position:
+            stats["positions_after_isomorphism_filter"] += 1
             
-            # Parse candidate moves to check confidence
-            candidate_moves = ast.literal_eval(candidate_moves_str)
-            best_move_key = str(best_move)
+            # Add the canonical version to the filtered positions
+            board_hash = board_to_hash(board)
+            seen_positions.add(board_hash)
             
-            # Only keep positions where the best move has high confidence
-            if best_move_key in candidate_moves and candidate_moves[best_move_key]["count"] >= confidence_threshold:
-                stats["positions_after_confidence_filter"] += 1
-                
-                # Convert board state to array
-                board = board_state_to_array(board_state_str)
-                
-                # Generate all isomorphic versions
-                isomorphisms = get_isomorphisms(board, best_move)
-                
-                # Check if we've seen any isomorphic version of this position
-                is_new_position = True
-                for iso_board, _ in isomorphisms:
-                    board_hash = board_to_hash(iso_board)
-                    if board_hash in seen_positions:
-                        is_new_position = False
-                        break
-                
-                if is_new_position:
-                    stats["positions_after_isomorphism_filter"] += 1
-                    
-                    # Add the canonical version to the filtered positions
-                    board_hash = board_to_hash(board)
-                    seen_positions.add(board_hash)
-                    
-                    filtered_positions.append((board, best_move))
+            filtered_positions.append((board, best_move))
     
     return filtered_positions, stats
 
+def sample_by_tactical_category(filtered_positions, samples_per_category, seed=0):
+    """
+    Sample positions evenly across tactical categories.
+    
+    Args:
+        filtered_positions: List of tuples (board_array, best_move)
+        samples_per_category: Maximum positions per category, or a dictionary
+            mapping category name to its sample size
+        seed: Random seed
+        
+    Returns:
+        sampled_positions: List of tuples (board_array, best_move)
+        category_counts: Dictionary mapping category name to number of sampled positions
+    """
+    if not filtered_positions:
+        return [], {}
+    
+    boards = np.stack([board for board, _ in filtered_positions])
+    categories = tactical_categories(analyze_positions(boards))
+    indices = stratified_sample(categories, samples_per_category, seed=seed)
+    
+    sampled_positions = [filtered_positions[i] for i in indices]
+    category_counts = {}
+    for i in indices:
+        category_counts[categories[i]] = category_counts.get(categories[i], 0) + 1
+    
+    return sampled_positions, category_counts
+
 def format_dataset(filtered_positions):
     """
     Format filtered positions into the final dataset format.
@@ -178,7 +258,7 @@ def format_dataset(filtered_positions):
     
     return dataset
 
-def convert_to_dataset(input_file, output_file, confidence_threshold=8):
+def convert_to_dataset(input_file, output_file, confidence_threshold=8, drop_terminal=False, drop_illegal_labels=False, samples_per_category=None, seed=0):
     """
     Convert the TSV file to a clean dataset with isomorphism handling.
     
@@ -186,9 +266,19 @@ def convert_to_dataset(input_file, output_file, confidence_threshold=8):
         input_file: Path to the input TSV file
         output_file: Path to the output JSON file
         confidence_threshold: Only keep moves with this count or higher
+        drop_terminal: Drop positions where a player already has five in a row
+        drop_illegal_labels: Drop positions whose best move is on an occupied cell
+        samples_per_category: If set, sample at most this many positions per
+            tactical category (or a dictionary of per-category sizes)
+        seed: Random seed for stratified sampling
     """
     # Step 1: Filter positions
-    filtered_positions, stats = filter_positions(input_file, confidence_threshold)
+    filtered_positions, stats = filter_positions(input_file, confidence_threshold, drop_terminal, drop_illegal_labels)
+    
+    # Optional: stratified sampling by tactical category
+    category_counts = None
+    if samples_per_category is not None:
+        filtered_positions, category_counts = sample_by_tactical_category(filtered_positions, samples_per_category, seed)
     
     # Step 2: Format the dataset
     dataset = format_dataset(filtered_positions)
@@ -197,7 +287,11 @@ def convert_to_dataset(input_file, output_file, confidence_threshold=8):
     print("\nDataset Statistics:")
     print(f"Total positions in input file: {stats['total_positions']}")
     print(f"Positions after confidence filter (count >= {confidence_threshold}): {stats['positions_after_confidence_filter']} ({stats['positions_after_confidence_filter']/stats['total_positions']*100:.2f}%)")
+    if drop_terminal or drop_illegal_labels:
+        print(f"Positions after tactical filter: {stats['positions_after_tactical_filter']}")
     print(f"Positions after isomorphism filter: {stats['positions_after_isomorphism_filter']} ({stats['positions_after_isomorphism_filter']/stats['positions_after_confidence_filter']*100:.2f}% of confident positions)")
+    if category_counts is not None:
+        print(f"Positions per tactical category: {category_counts}")
     print(f"Final dataset size: {len(dataset)}")
     
     # Save to JSON
@@ -206,11 +300,146 @@ def convert_to_dataset(input_file, output_file, confidence_threshold=8):
     
     print(f"\nDataset saved to {output_file}")
 
+def read_appended_rows(input_file, offset):
+    """
+    Read the complete TSV rows appended to a file since a byte offset.
+    
+    A trailing row without a newline is left for the next run, since a
+    generator may still be writing it.
+    
+    Args:
+        input_file: Path to the input TSV file
+        offset: Byte offset of the first unprocessed row (0 for a new file)
+        
+    Returns:
+        rows: List of parsed TSV rows (the header is skipped)
+        new_offset: Byte offset just past the last complete row
+    """
+    if os.path.getsize(input_file) < offset:
+        print(f"Warning: {input_file} is smaller than its indexed offset, reprocessing from the start")
+        offset = 0
+    
+    with open(input_file, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    
+    end = data.rfind(b'\n') + 1
+    lines = data[:end].decode('utf-8').splitlines()
+    if offset == 0 and lines:
+        lines = lines[1:]  # Skip header
+    
+    rows = [row for row in csv.reader(lines, delimiter='\t') if row]
+    return rows, offset + end
+
+def convert_to_dataset_incremental(input_files, output_file, index_dir, confidence_threshold=8, drop_terminal=False, drop_illegal_labels=False):
+    """
+    Incrementally convert TSV files, emitting only positions not seen in earlier runs.
+    
+    The index directory keeps the canonical hash of every emitted position and
+    the processed byte offset of each input file, so each run only reads rows
+    appended since the last one. New records are appended to output_file as
+    JSON Lines, one {"prompt", "ground_truth"} object per line.
+    
+    Args:
+        input_files: Path or list of paths to input TSV files
+        output_file: Path to the output JSON Lines file
+        index_dir: Directory holding the persistent position index
+        confidence_threshold: Only keep moves with this count or higher
+        drop_terminal: Drop positions where a player already has five in a row
+        drop_illegal_labels: Drop positions whose best move is on an occupied cell
+        
+    Returns:
+        stats: Dictionary with statistics about this run
+    """
+    if isinstance(input_files, str):
+        input_files = [input_files]
+    
+    index = PositionIndex(index_dir)
+    
+    # Drop records appended by a run that crashed before committing the index;
+    # their rows are re-read below since the input offsets were not committed
+    committed_length = index.get_output_length(output_file)
+    if committed_length is not None and os.path.exists(output_file):
+        if os.path.getsize(output_file) > committed_length:
+            print(f"Warning: truncating uncommitted records from {output_file}")
+            with open(output_file, 'r+b') as f:
+                f.truncate(committed_length)
+        elif os.path.getsize(output_file) < committed_length:
+            print(f"Warning: {output_file} is shorter than its committed length; indexed positions will not be re-emitted")
+    
+    stats = {
+        "new_rows": 0,
+        "positions_after_confidence_filter": 0,
+        "positions_after_tactical_filter": 0,
+        "new_unique_positions": 0,
+        "indexed_positions": 0
+    }
+    
+    # Step 1: Read and filter only the rows appended since the last run
+    confident_positions = []
+    new_offsets = {}
+    for input_file in input_files:
+        rows, new_offset = read_appended_rows(input_file, index.get_offset(input_file))
+        new_offsets[input_file] = new_offset
+        stats["new_rows"] += len(rows)
+        
+        for row in tqdm(rows, desc=f"Filtering {input_file}"):
+            position = parse_confident_row(row, confidence_threshold)
+            if position is not None:
+                confident_positions.append(position)
+    stats["positions_after_confidence_filter"] = len(confident_positions)
+    
+    confident_positions = apply_tactical_filters(confident_positions, drop_terminal, drop_illegal_labels)
+    stats["positions_after_tactical_filter"] = len(confident_positions)
+    
+    # Step 2: Keep the first occurrence of each position not already in the index
+    new_positions = []
+    new_hashes = np.zeros(0, dtype=np.uint64)
+    if confident_positions:
+        hashes = canonical_hashes(np.stack([board for board, _ in confident_positions]))
+        new_hashes, first_indices = np.unique(hashes, return_index=True)
+        is_new = ~index.contains(new_hashes)
+        new_hashes = new_hashes[is_new]
+        new_positions = [confident_positions[i] for i in np.sort(first_indices[is_new])]
+    stats["new_unique_positions"] = len(new_positions)
+    
+    # Step 3: Append new records, then commit hashes, offsets and the output
+    # length to the index together
+    dataset = format_dataset(new_positions)
+    with open(output_file, 'ab') as f:
+        for record in dataset:
+            f.write((json.dumps(record) + "\n").encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+        output_length = f.tell()
+    
+    index.set_output_length(output_file, output_length)
+    index.add(new_hashes)
+    for input_file, new_offset in new_offsets.items():
+        index.set_offset(input_file, new_offset)
+    index.save()
+    stats["indexed_positions"] = len(index)
+    
+    print("\nIncremental Build Statistics:")
+    print(f"New rows read: {stats['new_rows']}")
+    print(f"Positions after confidence filter (count >= {confidence_threshold}): {stats['positions_after_confidence_filter']}")
+    if drop_terminal or drop_illegal_labels:
+        print(f"Positions after tactical filter: {stats['positions_after_tactical_filter']}")
+    print(f"New unique positions: {stats['new_unique_positions']}")
+    print(f"Total positions in index: {stats['indexed_positions']}")
+    print(f"\nNew positions appended to {output_file}")
+    
+    return stats
+
 if __name__ == "__main__":
     # Settings
     input_file = "gomoku_data_repeat8.tsv"
     output_file = "gomoku_dataset_repeat8.json"
     confidence_threshold = 8  # Only keep moves with this count or higher
+    index_dir = None  # Set to a directory (e.g. "gomoku_index") for incremental JSON Lines builds
     
     print(f"Processing {input_file} with confidence threshold {confidence_threshold}")
-    convert_to_dataset(input_file, output_file, confidence_threshold) 
\ No newline at end of file
+    if index_dir:
+        convert_to_dataset_incremental(input_file, os.path.splitext(output_file)[0] + ".jsonl", index_dir, confidence_threshold)
+    else:
+        convert_to_dataset(input_file, output_file, confidence_threshold) 
\ No newline at end of file
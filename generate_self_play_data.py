@@ -1,10 +1,304 @@
 import os
 import csv
+import time
+import threading
 import multiprocessing as mp
 from solver import GomokuSolver
 
 
-def generate_data_worker(engine_path, worker_id, num_games, max_steps, output_file, max_memory_mb=50, timeout_match_ms=180000, timeout_turn_ms=5000, visualize=False, samples_per_position=8):
+def aggregate_samples(responses):
+    """
+    Aggregate several engine responses for the same position into one label.
+    
+    Args:
+        responses (list): Parsed responses from GomokuSolver.get_best_move
+        
+    Returns:
+        tuple: (majority_move, avg_score_eval, avg_mate_eval, move_counts), where
+            majority_move is the chosen entry of move_counts
+    """
+    move_counts = {}
+    score_eval_sum = 0
+    score_eval_count = 0
+    mate_eval_sum = 0
+    mate_eval_count = 0
+    
+    for parsed_response in responses:
+        best_move = parsed_response["best_move"]
+        evaluation = parsed_response["evaluation"]
+        
+        # Count occurrences of each move
+        move_key = str(best_move)
+        if move_key in move_counts:
+            move_counts[move_key]["count"] += 1
+            move_counts[move_key]["evaluations"].append(evaluation)
+        else:
+            move_counts[move_key] = {
+                "count": 1, 
+                "move": best_move,
+                "evaluations": [evaluation]
+            }
+        
+        # Handle different evaluation types
+        if evaluation:
+            if isinstance(evaluation, str) and ('+M' in evaluation or '-M' in evaluation):
+                # Handle mate evaluation
+                mate_num = int(evaluation.split('M')[1])
+                sign = 1 if '+M' in evaluation else -1
+                mate_eval_sum += sign * mate_num
+                mate_eval_count += 1
+            else:
+                # Handle score evaluation
+                try:
+                    score_eval_sum += float(evaluation)
+                    score_eval_count += 1
+                except (ValueError, TypeError):
+                    pass  # Skip if evaluation can't be converted to float
+    
+    # Calculate average evaluations
+    avg_score_eval = None
+    if score_eval_count > 0:
+        avg_score_eval = score_eval_sum / score_eval_count
+    
+    avg_mate_eval = None
+    if mate_eval_count > 0:
+        avg_mate_eval = mate_eval_sum / mate_eval_count
+        # Reconstruct the mate string (e.g., "+M53")
+        sign = '+' if avg_mate_eval > 0 else '-'
+        avg_mate_eval = f"{sign}M{abs(int(round(avg_mate_eval)))}"
+    
+    # Determine which moves have mate evaluations
+    moves_with_mate = {}
+    for move_key, move_data in move_counts.items():
+        for eval_str in move_data["evaluations"]:
+            if isinstance(eval_str, str) and ('+M' in eval_str or '-M' in eval_str):
+                if move_key not in moves_with_mate:
+                    moves_with_mate[move_key] = []
+                moves_with_mate[move_key].append(eval_str)
+    
+    # Choose the majority move, prioritizing mate evaluations
+    if moves_with_mate:
+        # If there are mate evaluations, choose the most frequent move with mate
+        mate_move_counts = {k: len(v) for k, v in moves_with_mate.items()}
+        majority_move_key = max(mate_move_counts, key=mate_move_counts.get)
+        majority_move = move_counts[majority_move_key]
+    else:
+        # Otherwise, choose the most frequent move overall
+        majority_move = max(move_counts.values(), key=lambda x: x["count"])
+
+    return majority_move, avg_score_eval, avg_mate_eval, move_counts
+
+
+def sample_position(solver, board_state, samples_per_position=8):
+    """
+    Query the engine several times for the same position and aggregate the votes.
+    
+    Args:
+        solver (GomokuSolver): Engine to query
+        board_state (list): List of (x, y, player) tuples, player 1 to move
+        samples_per_position (int): Number of engine queries
+        
+    Returns:
+        tuple: Same as aggregate_samples
+    """
+    responses = []
+    for _ in range(samples_per_position):
+        parsed_response, raw_output_str = solver.get_best_move(board_state)
+        responses.append(parsed_response)
+    return aggregate_samples(responses)
+
+
+class _SampleJob:
+    """Sampling work for one position, shared by the engines of a SpeculativeSampler."""
+
+    def __init__(self, board_state, num_samples):
+        self.board_state = board_state
+        self.num_samples = num_samples
+        self.claimed = 0
+        self.responses = []
+        self.engine_time = 0.0
+        self.cancelled = False
+
+    def is_done(self):
+        return len(self.responses) >= self.num_samples
+
+
+class SpeculativeSampler:
+    """
+    Sample positions on several engines, pre-analyzing the likely next position.
+    
+    Engines first fill the sample slots of the current position. Once every
+    slot is claimed, engines that would otherwise sit idle (waiting on the
+    last samples, or while the caller writes rows and checks the winner) start
+    on the position reached by the current leading move. If the leader changes
+    before the vote ends, that speculative job is cancelled, counted as
+    wasted, and replaced by one for the new leader. If the next requested
+    position is the predicted one, its samples are reused; otherwise they are
+    discarded.
+    """
+
+    def __init__(self, engines, samples_per_position=8):
+        self.samples_per_position = samples_per_position
+        self.cond = threading.Condition()
+        self.current = None
+        self.speculative = None
+        self.closed = False
+        # First exception raised by an engine; re-raised to the caller of sample()
+        self.error = None
+        self.stats = {
+            "positions": 0,
+            "predictions": 0,
+            "hits": 0,
+            "misses": 0,
+            "reused_samples": 0,
+            "wasted_samples": 0,
+            "wasted_engine_time_s": 0.0,
+            "wait_time_s": 0.0,
+        }
+        self.threads = [threading.Thread(target=self._engine_loop, args=(engine,), daemon=True) for engine in engines]
+        for thread in self.threads:
+            thread.start()
+
+    def _claim_job(self):
+        # The current position always takes priority over speculation
+        for job in (self.current, self.speculative):
+            if job is not None and not job.cancelled and job.claimed < job.num_samples:
+                job.claimed += 1
+                return job
+        return None
+
+    def _engine_loop(self, solver):
+        while True:
+            with self.cond:
+                job = self._claim_job()
+                while job is None and not self.closed:
+                    self.cond.wait()
+                    job = self._claim_job()
+                if self.closed:
+                    return
+            
+            start = time.perf_counter()
+            try:
+                parsed_response, raw_output_str = solver.get_best_move(job.board_state)
+            except Exception as e:
+                # The engine is unusable (e.g. it died); fail the sampler rather
+                # than leave the claimed slot unfilled
+                with self.cond:
+                    if self.error is None:
+                        self.error = e
+                    self.cond.notify_all()
+                return
+            elapsed = time.perf_counter() - start
+            
+            with self.cond:
+                job.engine_time += elapsed
+                if job.cancelled:
+                    self.stats["wasted_samples"] += 1
+                    self.stats["wasted_engine_time_s"] += elapsed
+                else:
+                    job.responses.append(parsed_response)
+                self.cond.notify_all()
+
+    def _leading_move(self, job):
+        """Return the move currently winning the vote for job, or None before it is worth speculating on."""
+        if not job.responses or job.claimed < job.num_samples:
+            return None
+        majority_move, _, _, _ = aggregate_samples(job.responses)
+        return majority_move["move"]
+
+    def _discard(self, job):
+        job.cancelled = True
+        self.stats["misses"] += 1
+        self.stats["wasted_samples"] += len(job.responses)
+        self.stats["wasted_engine_time_s"] += job.engine_time
+
+    def sample(self, board_state, predict_next_state=None):
+        """
+        Sample a position and aggregate the votes, as sample_position does.
+        
+        Args:
+            board_state (list): List of (x, y, player) tuples, player 1 to move
+            predict_next_state (callable): Maps a candidate winning move of this position
+                to the next position that will be requested, or None if there is none;
+                called again whenever the leading move changes
+            
+        Returns:
+            tuple: Same as aggregate_samples
+        """
+        start = time.perf_counter()
+        with self.cond:
+            self.stats["positions"] += 1
+            job = self.speculative
+            self.speculative = None
+            if job is not None and job.board_state == board_state:
+                self.stats["hits"] += 1
+                self.stats["reused_samples"] += job.claimed
+            else:
+                if job is not None:
+                    self._discard(job)
+                job = _SampleJob(board_state, self.samples_per_position)
+            self.current = job
+            self.cond.notify_all()
+        
+        # Move the queued speculative job was predicted from
+        predicted_move = None
+        while True:
+            with self.cond:
+                while True:
+                    if self.error is not None:
+                        self.current = None
+                        raise self.error
+                    move = self._leading_move(job) if predict_next_state is not None else None
+                    if move is not None and move != predicted_move:
+                        break
+                    if job.is_done():
+                        self.current = None
+                        responses = list(job.responses)
+                        self.stats["wait_time_s"] += time.perf_counter() - start
+                        return aggregate_samples(responses)
+                    self.cond.wait()
+                
+                # The leader changed; its old speculation is a wrong guess
+                if self.speculative is not None:
+                    self._discard(self.speculative)
+                    self.speculative = None
+                predicted_move = move
+            
+            # predict_next_state may be slow (e.g. a winner check), so engines
+            # posting responses must not wait on it
+            next_state = predict_next_state(move)
+            if next_state is not None:
+                with self.cond:
+                    self.stats["predictions"] += 1
+                    self.speculative = _SampleJob(next_state, self.samples_per_position)
+                    self.cond.notify_all()
+
+    def close(self):
+        """Stop the engine threads after their in-flight queries and discard any pending speculation."""
+        with self.cond:
+            if self.speculative is not None:
+                self._discard(self.speculative)
+                self.speculative = None
+            self.closed = True
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def format_stats(self):
+        stats = self.stats
+        resolved = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / resolved * 100 if resolved else 0.0
+        per_position_ms = stats["wait_time_s"] / stats["positions"] * 1000 if stats["positions"] else 0.0
+        return (
+            f"positions {stats['positions']}, predictions {stats['predictions']}, "
+            f"hit rate {hit_rate:.1f}% ({stats['hits']}/{resolved}), "
+            f"reused samples {stats['reused_samples']}, wasted samples {stats['wasted_samples']}, "
+            f"wasted engine time {stats['wasted_engine_time_s']:.1f}s, "
+            f"avg wait per position {per_position_ms:.0f}ms"
+        )
+
+
+def generate_data_worker(engine_path, worker_id, num_games, max_steps, output_file, max_memory_mb=50, timeout_match_ms=180000, timeout_turn_ms=5000, visualize=False, samples_per_position=8, speculative_engines=0):
     solver = GomokuSolver(
         engine_path,
         max_memory_mb=max_memory_mb,
@@ -13,6 +307,20 @@ def generate_data_worker(engine_path, worker_id, num_games, max_steps, output_fi
     )
     current_step = 0
     
+    # Extra engines sample alongside the main one and pre-analyze the predicted next position
+    sampler = None
+    if speculative_engines > 0:
+        engines = [solver] + [
+            GomokuSolver(
+                engine_path,
+                max_memory_mb=max_memory_mb,
+                timeout_match_ms=timeout_match_ms,
+                timeout_turn_ms=timeout_turn_ms
+            )
+            for _ in range(speculative_engines)
+        ]
+        sampler = SpeculativeSampler(engines, samples_per_position)
+    
     # Open file in append mode
     with open(output_file, 'a', newline='') as f:
         writer = csv.writer(f, delimiter='\t')
@@ -22,75 +330,19 @@ def generate_data_worker(engine_path, worker_id, num_games, max_steps, output_fi
             current_board_state = []
             while True:
                 # Collect multiple samples for the same position
-                move_counts = {}
-                score_eval_sum = 0
-                score_eval_count = 0
-                mate_eval_sum = 0
-                mate_eval_count = 0
-                
-                for _ in range(samples_per_position):
-                    parsed_response, raw_output_str = solver.get_best_move(current_board_state)
-                    best_move = parsed_response["best_move"]
-                    evaluation = parsed_response["evaluation"]
-                    
-                    # Count occurrences of each move
-                    move_key = str(best_move)
-                    if move_key in move_counts:
-                        move_counts[move_key]["count"] += 1
-                        move_counts[move_key]["evaluations"].append(evaluation)
-                    else:
-                        move_counts[move_key] = {
-                            "count": 1, 
-                            "move": best_move,
-                            "evaluations": [evaluation]
-                        }
+                if sampler is not None:
+                    def predict_next_state(move):
+                        next_state = solver.switch_board_side(current_board_state + [(move[0], move[1], 1)])
+                        if current_step + 1 >= max_steps:
+                            return None
+                        if solver.check_winner(next_state):
+                            # The next game starts from the empty board
+                            return [] if i + 1 < num_games else None
+                        return next_state
                     
-                    # Handle different evaluation types
-                    if evaluation:
-                        if isinstance(evaluation, str) and ('+M' in evaluation or '-M' in evaluation):
-                            # Handle mate evaluation
-                            mate_num = int(evaluation.split('M')[1])
-                            sign = 1 if '+M' in evaluation else -1
-                            mate_eval_sum += sign * mate_num
-                            mate_eval_count += 1
-                        else:
-                            # Handle score evaluation
-                            try:
-                                score_eval_sum += float(evaluation)
-                                score_eval_count += 1
-                            except (ValueError, TypeError):
-                                pass  # Skip if evaluation can't be converted to float
-                
-                # Calculate average evaluations
-                avg_score_eval = None
-                if score_eval_count > 0:
-                    avg_score_eval = score_eval_sum / score_eval_count
-                
-                avg_mate_eval = None
-                if mate_eval_count > 0:
-                    avg_mate_eval = mate_eval_sum / mate_eval_count
-                    # Reconstruct the mate string (e.g., "+M53")
-                    sign = '+' if avg_mate_eval > 0 else '-'
-                    avg_mate_eval = f"{sign}M{abs(int(round(avg_mate_eval)))}"
-                
-                # Determine which moves have mate evaluations
-                moves_with_mate = {}
-                for move_key, move_data in move_counts.items():
-                    for eval_str in move_data["evaluations"]:
-                        if isinstance(eval_str, str) and ('+M' in eval_str or '-M' in eval_str):
-                            if move_key not in moves_with_mate:
-                                moves_with_mate[move_key] = []
-                            moves_with_mate[move_key].append(eval_str)
-                
-                # Choose the majority move, prioritizing mate evaluations
-                if moves_with_mate:
-                    # If there are mate evaluations, choose the most frequent move with mate
-                    mate_move_counts = {k: len(v) for k, v in moves_with_mate.items()}
-                    majority_move_key = max(mate_move_counts, key=mate_move_counts.get)
-                    majority_move = move_counts[majority_move_key]
+                    majority_move, avg_score_eval, avg_mate_eval, move_counts = sampler.sample(current_board_state, predict_next_state)
                 else:
-                    # Otherwise, choose the most frequent move overall
-                    majority_move = max(move_counts.values(), key=lambda x: x["count"])
+                    majority_move, avg_score_eval, avg_mate_eval, move_counts = sample_position(solver, current_board_state, samples_per_position)
                 
                 # Save data and flush immediately
                 if current_board_state:
@@ -119,8 +371,12 @@ def generate_data_worker(engine_path, worker_id, num_games, max_steps, output_fi
                 
                 if winner or current_step >= max_steps:
                     break
+    
+    if sampler is not None:
+        sampler.close()
+        print(f"Worker {worker_id}: Speculation stats: {sampler.format_stats()}")
 
-def generate_self_play_data(engine_path, num_games=10, max_steps=100, visualize=False, num_processes=1, output_file="gomoku_data.tsv", max_memory_mb=50, timeout_match_ms=180000, timeout_turn_ms=5000, samples_per_position=8, **kwargs):
+def generate_self_play_data(engine_path, num_games=10, max_steps=100, visualize=False, num_processes=1, output_file="gomoku_data.tsv", max_memory_mb=50, timeout_match_ms=180000, timeout_turn_ms=5000, samples_per_position=8, speculative_engines=0, **kwargs):
     # Create output file with headers if it doesn't exist
     if not os.path.exists(output_file):
         with open(output_file, 'w', newline='') as f:
@@ -139,7 +395,7 @@ def generate_self_play_data(engine_path, num_games=10, max_steps=100, visualize=
             if process_games > 0:
                 p = mp.Process(
                     target=generate_data_worker,
-                    args=(engine_path, i, process_games, max_steps, output_file, max_memory_mb, timeout_match_ms, timeout_turn_ms, visualize, samples_per_position)
+                    args=(engine_path, i, process_games, max_steps, output_file, max_memory_mb, timeout_match_ms, timeout_turn_ms, visualize, samples_per_position, speculative_engines)
                 )
                 processes.append(p)
                 p.start()
@@ -149,7 +405,7 @@ def generate_self_play_data(engine_path, num_games=10, max_steps=100, visualize=
             p.join()
     else:
         # Single process mode
-        generate_data_worker(engine_path, 0, num_games, max_steps, output_file, max_memory_mb, timeout_match_ms, timeout_turn_ms, visualize, samples_per_position)
+        generate_data_worker(engine_path, 0, num_games, max_steps, output_file, max_memory_mb, timeout_match_ms, timeout_turn_ms, visualize, samples_per_position, speculative_engines)
 
 
 if __name__ == "__main__":
@@ -166,6 +422,7 @@ if __name__ == "__main__":
         "num_processes": 24,
         "output_file": "gomoku_data_repeat8.tsv",
         "samples_per_position": 8,  # Number of samples to collect per position
+        "speculative_engines": 0,  # Extra engines per process that pre-analyze the likely next position
     }
     
     generate_self_play_data(
@@ -178,5 +435,6 @@ if __name__ == "__main__":
         timeout_match_ms=settings["timeout_match_ms"],
         timeout_turn_ms=settings["timeout_turn_ms"],
         samples_per_position=settings["samples_per_position"],
+        speculative_engines=settings["speculative_engines"],
         visualize=False
     )
\ No newline at end of file
@@ -0,0 +1,290 @@
+"""
+Unified command line for the Gomoku data pipeline.
+
+    python gomoku.py selfplay --num-games 100 --num-processes 24
+    python gomoku.py convert --index-dir gomoku_index
+    python gomoku.py analyze --input-file gomoku_data_repeat8.tsv
+    python gomoku.py relabel --timeout-turn-ms 120000 --max-positions 1000
+    python gomoku.py serve --num-engines 8
+    python gomoku.py demo
+
+Settings come from flags or from a JSON file passed with --config. Top-level
+keys apply to every subcommand that takes them, keys under a subcommand name
+apply to that subcommand only, and flags given on the command line override
+both:
+
+    {"engine": "engines/EMBRYO21.E/pbrain-embryo21_e.exe",
+     "selfplay": {"num_processes": 24, "timeout_turn_ms": 60000}}
+
+--config may be given both before and after the subcommand; settings from the
+file after the subcommand override those from the file before it.
+
+Only the standard library is imported at startup; each subcommand imports
+the modules (and numpy, pandas, ...) it needs when it runs.
+"""
+import os
+import sys
+import json
+import argparse
+
+DEFAULT_ENGINE = os.path.join("engines", "EMBRYO21.E", "pbrain-embryo21_e.exe")
+
+
+def run_selfplay(args):
+    from generate_self_play_data import generate_self_play_data
+    generate_self_play_data(
+        args.engine,
+        num_games=args.num_games,
+        max_steps=args.max_steps,
+        visualize=args.visualize,
+        num_processes=args.num_processes,
+        output_file=args.output_file,
+        max_memory_mb=args.max_memory_mb,
+        timeout_match_ms=args.timeout_match_ms,
+        timeout_turn_ms=args.timeout_turn_ms,
+        samples_per_position=args.samples_per_position,
+        speculative_engines=args.speculative_engines,
+    )
+
+
+def run_convert(args):
+    from convert_to_dataset import convert_to_dataset, convert_to_dataset_incremental
+    if args.index_dir:
+        # Incremental builds keep every new position, so there is nothing to sample
+        if args.samples_per_category is not None or args.seed is not None:
+            sys.exit("convert: --samples-per-category and --seed cannot be used with --index-dir")
+        output_file = args.output_file or "gomoku_dataset.jsonl"
+        convert_to_dataset_incremental(
+            args.input_files,
+            output_file,
+            args.index_dir,
+            confidence_threshold=args.confidence_threshold,
+            drop_terminal=args.drop_terminal,
+            drop_illegal_labels=args.drop_illegal_labels,
+        )
+    else:
+        if len(args.input_files) != 1:
+            sys.exit("convert: multiple input files require --index-dir")
+        convert_to_dataset(
+            args.input_files[0],
+            args.output_file or "gomoku_dataset.json",
+            confidence_threshold=args.confidence_threshold,
+            drop_terminal=args.drop_terminal,
+            drop_illegal_labels=args.drop_illegal_labels,
+            samples_per_category=args.samples_per_category,
+            seed=args.seed if args.seed is not None else 0,
+        )
+
+
+def run_analyze(args):
+    from analysis import analyze_data
+    analyze_data(args.input_file, plot_file=args.plot_file, show_plots=not args.no_show)
+
+
+def run_relabel(args):
+    from relabel_dataset import relabel_dataset
+    relabel_dataset(
+        args.engine,
+        args.input_files,
+        args.output_file,
+        num_processes=args.num_processes,
+        max_memory_mb=args.max_memory_mb,
+        timeout_match_ms=args.timeout_match_ms,
+        timeout_turn_ms=args.timeout_turn_ms,
+        samples_per_position=args.samples_per_position,
+        max_positions=args.max_positions,
+    )
+
+
+def run_serve(args):
+    from analysis_server import serve
+    serve(
+        args.engine,
+        host=args.host,
+        port=args.port,
+        num_engines=args.num_engines,
+        cache_size=args.cache_size,
+        max_pending=args.max_pending,
+        queue_timeout_s=args.queue_timeout_s,
+        max_memory_mb=args.max_memory_mb,
+        timeout_match_ms=args.timeout_match_ms,
+        timeout_turn_ms=args.timeout_turn_ms,
+    )
+
+
+def run_demo(args):
+    from solver import GomokuSolver
+    from demo_self_play import demo_self_play
+    solver = GomokuSolver(
+        args.engine,
+        max_memory_mb=args.max_memory_mb,
+        timeout_match_ms=args.timeout_match_ms,
+        timeout_turn_ms=args.timeout_turn_ms
+    )
+    try:
+        demo_self_play(solver)
+    finally:
+        solver.close()
+
+
+def _add_engine_arguments(parser, timeout_turn_ms=5000, max_memory_mb=50):
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, help="Path to the pbrain engine executable")
+    parser.add_argument("--max-memory-mb", type=int, default=max_memory_mb, help="Engine memory limit per engine")
+    parser.add_argument("--timeout-match-ms", type=int, default=180000, help="Engine match time budget")
+    parser.add_argument("--timeout-turn-ms", type=int, default=timeout_turn_ms, help="Engine time budget per move")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="gomoku", description="Gomoku self-play data pipeline")
+    parser.add_argument("--config", help="JSON file with default settings")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Lets --config also follow the subcommand; it is stored separately so a
+    # file given before the subcommand is not replaced by one given after it
+    config_parent = argparse.ArgumentParser(add_help=False)
+    config_parent.add_argument("--config", dest="command_config", metavar="CONFIG", help="JSON file with default settings, overriding a --config given before the subcommand")
+
+    selfplay = subparsers.add_parser("selfplay", help="Generate self-play training data", parents=[config_parent])
+    _add_engine_arguments(selfplay)
+    selfplay.add_argument("--num-games", type=int, default=10)
+    selfplay.add_argument("--max-steps", type=int, default=100, help="Total moves per process across all games")
+    selfplay.add_argument("--num-processes", type=int, default=1)
+    selfplay.add_argument("--output-file", default="gomoku_data.tsv")
+    selfplay.add_argument("--samples-per-position", type=int, default=8)
+    selfplay.add_argument("--speculative-engines", type=int, default=0, help="Extra engines per process that pre-analyze the likely next position")
+    selfplay.add_argument("--visualize", action="store_true")
+    selfplay.set_defaults(handler=run_selfplay)
+
+    convert = subparsers.add_parser("convert", help="Convert self-play TSV data into a dataset", parents=[config_parent])
+    convert.add_argument("--input-files", nargs="+", default=["gomoku_data_repeat8.tsv"])
+    convert.add_argument("--output-file", help="Defaults to gomoku_dataset.json, or gomoku_dataset.jsonl with --index-dir")
+    convert.add_argument("--confidence-threshold", type=int, default=8)
+    convert.add_argument("--drop-terminal", action="store_true")
+    convert.add_argument("--drop-illegal-labels", action="store_true")
+    convert.add_argument("--samples-per-category", type=int, help="Sample at most this many positions per tactical category")
+    convert.add_argument("--seed", type=int, help="Random seed for --samples-per-category (default 0)")
+    convert.add_argument("--index-dir", help="Persistent index directory; enables incremental builds")
+    convert.set_defaults(handler=run_convert)
+
+    analyze = subparsers.add_parser("analyze", help="Plot and summarize self-play evaluations", parents=[config_parent])
+    analyze.add_argument("--input-file", default="gomoku_data.tsv")
+    analyze.add_argument("--plot-file", help="Save the plots to this path")
+    analyze.add_argument("--no-show", action="store_true", help="Do not open a plot window")
+    analyze.set_defaults(handler=run_analyze)
+
+    relabel = subparsers.add_parser("relabel", help="Re-analyze dataset positions with a larger budget", parents=[config_parent])
+    _add_engine_arguments(relabel, timeout_turn_ms=30000)
+    relabel.add_argument("--input-files", nargs="+", default=["gomoku_data_repeat8.tsv"])
+    relabel.add_argument("--output-file", default="gomoku_relabel.tsv")
+    relabel.add_argument("--num-processes", type=int, default=1)
+    relabel.add_argument("--samples-per-position", type=int, default=8)
+    relabel.add_argument("--max-positions", type=int)
+    relabel.set_defaults(handler=run_relabel)
+
+    serve = subparsers.add_parser("serve", help="Run the local analysis server", parents=[config_parent])
+    _add_engine_arguments(serve)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--num-engines", type=int, default=4)
+    serve.add_argument("--cache-size", type=int, default=10000)
+    serve.add_argument("--max-pending", type=int, default=256)
+    serve.add_argument("--queue-timeout-s", type=float, default=30.0)
+    serve.set_defaults(handler=run_serve)
+
+    demo = subparsers.add_parser("demo", help="Watch the engine play itself", parents=[config_parent])
+    _add_engine_arguments(demo)
+    demo.set_defaults(handler=run_demo)
+
+    return parser, subparsers.choices
+
+
+def _convert_setting(action, value):
+    """Convert a config value the way argparse converts the matching flag."""
+    if action.nargs == 0:
+        if not isinstance(value, bool):
+            raise ValueError("expected true or false")
+        return value
+    if value is None:
+        return None
+    if action.nargs in ("+", "*"):
+        # A single value is accepted for list-valued flags, as on the command line
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list) or (action.nargs == "+" and not value):
+            raise ValueError("expected a list")
+        return [_convert_scalar(action, v) for v in value]
+    return _convert_scalar(action, value)
+
+
+def _convert_scalar(action, value):
+    convert = action.type or str
+    # JSON numbers are not silently turned into paths, nor 7.5 into 7
+    if (isinstance(value, (bool, list, dict))
+            or (convert is str and not isinstance(value, str))
+            or (convert is int and isinstance(value, float))):
+        raise ValueError(f"expected {convert.__name__}, got {value!r}")
+    try:
+        return convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"expected {convert.__name__}, got {value!r}")
+
+
+def load_config(config_file, command, actions):
+    """
+    Merge the top-level settings of a config file with its section for command.
+    
+    Top-level settings the subcommand does not take are ignored, since they
+    are shared by all subcommands; unknown settings in the subcommand's own
+    section are an error. Values are type-checked and converted like the
+    matching flags.
+    
+    Args:
+        config_file: Path to the JSON config file
+        command: Subcommand name
+        actions: Dictionary mapping setting name to the subcommand's argparse action
+        
+    Returns:
+        settings: Dictionary of converted settings
+    """
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    settings = {k: v for k, v in config.items() if not isinstance(v, dict) and k in actions}
+    section = config.get(command, {})
+    unknown = sorted(set(section) - set(actions))
+    if unknown:
+        raise ValueError(f"unknown settings for {command} in {config_file}: {', '.join(unknown)}")
+    settings.update(section)
+    
+    converted = {}
+    for key, value in settings.items():
+        try:
+            converted[key] = _convert_setting(actions[key], value)
+        except ValueError as e:
+            raise ValueError(f"invalid setting {key} in {config_file}: {e}")
+    return converted
+
+
+def main(argv=None):
+    parser, subparsers = build_parser()
+    args = parser.parse_args(argv)
+
+    config_files = [f for f in (args.config, args.command_config) if f]
+    if config_files:
+        # Config values become defaults, so explicit flags still take precedence;
+        # a file given after the subcommand overrides one given before it
+        subparser = subparsers[args.command]
+        actions = {action.dest: action for action in subparser._actions if action.dest not in ("help", "command_config")}
+        settings = {}
+        for config_file in config_files:
+            try:
+                settings.update(load_config(config_file, args.command, actions))
+            except (OSError, ValueError) as e:
+                parser.error(str(e))
+        subparser.set_defaults(**settings)
+        args = parser.parse_args(argv)
+
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
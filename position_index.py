@@ -0,0 +1,175 @@
+import os
+import json
+import numpy as np
+
+BOARD_SIZE = 15
+
+# Fixed seed so hashes are stable across runs and machines
+ZOBRIST_SEED = 20240229
+ZOBRIST_TABLE = np.random.default_rng(ZOBRIST_SEED).integers(
+    0, np.iinfo(np.uint64).max, size=(BOARD_SIZE * BOARD_SIZE, 3), dtype=np.uint64, endpoint=True
+)
+# Empty cells do not contribute to the hash
+ZOBRIST_TABLE[:, 0] = 0
+
+
+def board_symmetries(boards):
+    """
+    Generate the 8 rotations and reflections of a batch of boards.
+
+    Args:
+        boards (np.ndarray): (N, 15, 15) array
+
+    Returns:
+        list: 8 arrays of shape (N, 15, 15)
+    """
+    flipped = boards[:, :, ::-1]
+    symmetries = []
+    for board in (boards, flipped):
+        for k in range(4):
+            symmetries.append(np.rot90(board, k=k, axes=(1, 2)))
+    return symmetries
+
+
+def zobrist_hashes(boards):
+    """
+    Compute 64-bit Zobrist hashes for a batch of boards.
+
+    Args:
+        boards (np.ndarray): (N, 15, 15) array of 0 (empty), 1 and 2
+
+    Returns:
+        np.ndarray: (N,) uint64 hashes
+    """
+    cells = np.ascontiguousarray(boards).reshape(boards.shape[0], -1).astype(np.intp)
+    return np.bitwise_xor.reduce(ZOBRIST_TABLE[np.arange(cells.shape[1]), cells], axis=1)
+
+
+def canonical_hashes(boards, chunk_size=65536):
+    """
+    Compute a 64-bit hash per board that is identical for all isomorphic boards.
+
+    Boards are hashed in chunks so the per-symmetry intermediates stay small
+    for millions of positions.
+
+    Args:
+        boards (np.ndarray): (N, 15, 15) array of 0 (empty), 1 and 2
+        chunk_size (int): Number of boards hashed per vectorized chunk
+
+    Returns:
+        np.ndarray: (N,) uint64 hashes, the minimum Zobrist hash over the 8 symmetries
+    """
+    boards = np.asarray(boards)
+    if boards.ndim == 2:
+        boards = boards[np.newaxis]
+    hashes = np.empty(boards.shape[0], dtype=np.uint64)
+    for start in range(0, boards.shape[0], chunk_size):
+        end = min(start + chunk_size, boards.shape[0])
+        chunk_hashes = hashes[start:end]
+        for i, symmetry in enumerate(board_symmetries(boards[start:end])):
+            symmetry_hashes = zobrist_hashes(symmetry)
+            if i == 0:
+                chunk_hashes[:] = symmetry_hashes
+            else:
+                np.minimum(chunk_hashes, symmetry_hashes, out=chunk_hashes)
+    return hashes
+
+
+class PositionIndex:
+    """
+    Persistent index of canonical position hashes and per-file read offsets.
+
+    The index is a directory holding:
+        hashes-<generation>.npy: sorted uint64 array of canonical hashes,
+            memory-mapped on load
+        offsets.json: byte offset of the first unprocessed row of each input file,
+            the committed byte length of each output file, and the name of the
+            current hashes file
+
+    Replacing offsets.json is the single commit point, so hashes, offsets and
+    output lengths always change together.
+    """
+
+    OFFSETS_FILE = "offsets.json"
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+
+        offsets_path = os.path.join(index_dir, self.OFFSETS_FILE)
+        if os.path.exists(offsets_path):
+            with open(offsets_path, 'r') as f:
+                self.offsets = json.load(f)
+        else:
+            self.offsets = {"generation": 0, "hashes_file": None, "inputs": {}, "outputs": {}}
+
+        if self.offsets["hashes_file"]:
+            self.hashes = np.load(os.path.join(index_dir, self.offsets["hashes_file"]), mmap_mode='r')
+        else:
+            self.hashes = np.zeros(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def contains(self, hashes):
+        """
+        Check which hashes are already in the index.
+
+        Args:
+            hashes (np.ndarray): (N,) uint64 hashes
+
+        Returns:
+            np.ndarray: (N,) bool, True where the hash is already indexed
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(self.hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        positions = np.searchsorted(self.hashes, hashes)
+        positions = np.minimum(positions, len(self.hashes) - 1)
+        return self.hashes[positions] == hashes
+
+    def get_offset(self, input_file):
+        return self.offsets["inputs"].get(os.path.abspath(input_file), 0)
+
+    def set_offset(self, input_file, offset):
+        self.offsets["inputs"][os.path.abspath(input_file)] = offset
+
+    def get_output_length(self, output_file):
+        """Return the output length committed with the index, or None if never written."""
+        return self.offsets["outputs"].get(os.path.abspath(output_file))
+
+    def set_output_length(self, output_file, length):
+        self.offsets["outputs"][os.path.abspath(output_file)] = length
+
+    def add(self, hashes):
+        """Merge new hashes into the index (kept in memory until save)."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) == 0:
+            return
+        self.hashes = np.union1d(self.hashes, hashes)
+
+    def save(self):
+        """Write a new hashes file, then atomically commit it with the offsets."""
+        old_hashes_file = self.offsets["hashes_file"]
+        generation = self.offsets["generation"] + 1
+        hashes_file = f"hashes-{generation}.npy"
+        # Write through a file object so np.save does not append another ".npy"
+        with open(os.path.join(self.index_dir, hashes_file), 'wb') as f:
+            np.save(f, np.asarray(self.hashes, dtype=np.uint64))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.offsets["generation"] = generation
+        self.offsets["hashes_file"] = hashes_file
+        offsets_path = os.path.join(self.index_dir, self.OFFSETS_FILE)
+        tmp_path = offsets_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.offsets, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, offsets_path)
+
+        # Release the memory map before removing the file it points to
+        self.hashes = np.array(self.hashes)
+        if old_hashes_file:
+            os.remove(os.path.join(self.index_dir, old_hashes_file))
@@ -0,0 +1,365 @@
+import os
+import csv
+import ast
+import json
+import multiprocessing as mp
+import numpy as np
+from board_features import board_states_to_arrays
+from position_index import canonical_hashes
+from convert_to_dataset import get_isomorphisms
+from generate_self_play_data import sample_position
+from solver import GomokuSolver
+
+RELABEL_HEADER = [
+    "position_hash", "board_state",
+    "old_best_move", "old_score_evaluation", "old_mate_evaluation", "old_confidence", "old_disagreement",
+    "new_best_move", "new_score_evaluation", "new_mate_evaluation", "new_candidate_moves", "new_confidence",
+    "label_changed",
+]
+
+# Engine owned by each pool process, created once by the pool initializer
+_worker_solver = None
+_worker_samples = 8
+
+
+def parse_board_string(board_str):
+    """
+    Parse a board rendered by convert_to_dataset.board_to_string_representation.
+
+    Args:
+        board_str (str): Board text (a dataset prompt is accepted as well)
+
+    Returns:
+        list: List of (x, y, player) tuples, X is player 1 and O is player 2
+    """
+    board_state = []
+    for line in board_str.splitlines():
+        row_label, sep, cells = line.partition('|')
+        if not sep or not row_label.strip().isdigit():
+            continue
+        y = int(row_label)
+        for x, symbol in enumerate(cells.split()):
+            if symbol == 'X':
+                board_state.append((x, y, 1))
+            elif symbol == 'O':
+                board_state.append((x, y, 2))
+    return board_state
+
+
+def load_tsv_positions(input_file):
+    """
+    Load positions from a self-play TSV file, merging repeated positions.
+
+    Args:
+        input_file (str): Path to a TSV file written by generate_self_play_data
+
+    Returns:
+        list: Position dictionaries with board_state, old label and confidence
+    """
+    positions = []
+    with open(input_file, 'r', newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader)  # Skip header
+        for row in reader:
+            if len(row) < 5:
+                continue
+            candidate_moves = ast.literal_eval(row[4])
+            best_move = ast.literal_eval(row[1])
+            positions.append({
+                "board_state": ast.literal_eval(row[0]),
+                "best_move": best_move,
+                "score_evaluation": row[2],
+                "mate_evaluation": row[3],
+                "candidate_moves": candidate_moves,
+            })
+    return positions
+
+
+def load_json_positions(input_file):
+    """
+    Load positions from a dataset JSON (or JSON Lines) file.
+
+    Dataset records carry no vote counts, so their confidence is unknown.
+
+    Args:
+        input_file (str): Path to a file written by convert_to_dataset
+
+    Returns:
+        list: Position dictionaries with board_state and old label
+    """
+    with open(input_file, 'r') as f:
+        if input_file.endswith('.jsonl'):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = json.load(f)
+
+    positions = []
+    for record in records:
+        positions.append({
+            "board_state": parse_board_string(record["prompt"]),
+            "best_move": ast.literal_eval(record["ground_truth"]),
+            "score_evaluation": None,
+            "mate_evaluation": None,
+            "candidate_moves": None,
+        })
+    return positions
+
+
+def _orient_move(board, move, target_board):
+    """
+    Map a move on board into the orientation of target_board.
+
+    Args:
+        board (np.ndarray): 15x15 board the move was played on
+        move (tuple): (x, y) move on board
+        target_board (np.ndarray): Rotated or mirrored copy of board
+
+    Returns:
+        tuple: (x, y) move on target_board
+    """
+    for iso_board, iso_move in get_isomorphisms(board, move):
+        if np.array_equal(iso_board, target_board):
+            return tuple(iso_move)
+    raise ValueError("boards are not isomorphic")
+
+
+def merge_positions(positions):
+    """
+    Merge isomorphic repeats of the same position and score their label quality.
+
+    Repeats that are rotated or mirrored are mapped into the orientation of
+    the first one, then their votes and labels are pooled. The old best move
+    is the pooled majority (by votes, or by label count when votes are
+    unknown). A position disagrees if its repeats were labeled with different
+    best moves.
+
+    Args:
+        positions (list): Position dictionaries from load_tsv_positions / load_json_positions
+
+    Returns:
+        list: One dictionary per unique position with position_hash, best_move
+            (pooled majority), confidence (share of pooled votes for it, None
+            if unknown) and disagreement (number of distinct old best moves minus one)
+    """
+    if not positions:
+        return []
+
+    boards = board_states_to_arrays([p["board_state"] for p in positions])
+    hashes = canonical_hashes(boards)
+
+    merged = {}
+    for position, board, position_hash in zip(positions, boards, hashes):
+        key = format(int(position_hash), '016x')
+        if key not in merged:
+            merged[key] = dict(position, position_hash=key, board=board, labels=[], label_counts={}, votes={})
+        entry = merged[key]
+
+        if np.array_equal(board, entry["board"]):
+            orient = tuple
+        else:
+            orient = lambda move: _orient_move(board, move, entry["board"])
+
+        best_move = orient(position["best_move"])
+        entry["labels"].append((best_move, position["score_evaluation"], position["mate_evaluation"]))
+        entry["label_counts"][best_move] = entry["label_counts"].get(best_move, 0) + 1
+        if position["candidate_moves"] is not None:
+            for move_data in position["candidate_moves"].values():
+                move = orient(move_data["move"])
+                entry["votes"][move] = entry["votes"].get(move, 0) + move_data["count"]
+
+    unique_positions = []
+    for entry in merged.values():
+        counts = entry["votes"] or entry["label_counts"]
+        best_move = max(counts, key=counts.get)
+        # Report the evaluations of the first repeat that chose the pooled majority
+        labels = [label for label in entry["labels"] if label[0] == best_move] or entry["labels"]
+        entry["best_move"], entry["score_evaluation"], entry["mate_evaluation"] = labels[0]
+
+        total_votes = sum(entry["votes"].values())
+        entry["confidence"] = entry["votes"].get(best_move, 0) / total_votes if total_votes else None
+        entry["disagreement"] = len(entry["label_counts"]) - 1
+        del entry["board"], entry["labels"]
+        unique_positions.append(entry)
+    return unique_positions
+
+
+def prioritize_positions(positions):
+    """
+    Order positions so the least trustworthy labels are relabeled first.
+
+    Disagreeing positions come first, then ascending confidence; positions
+    with unknown confidence keep their input order at the end.
+    """
+    def priority(position):
+        confidence = position["confidence"]
+        return (-position["disagreement"], confidence is None, confidence if confidence is not None else 0.0)
+    return sorted(positions, key=priority)
+
+
+def load_done_hashes(output_file):
+    """
+    Read the position hashes already relabeled in an output file.
+
+    A trailing partial row left by an interrupted run is truncated so new
+    rows can be appended cleanly.
+
+    Returns:
+        set: position_hash values already present in the output file
+    """
+    if not os.path.exists(output_file):
+        return set()
+
+    with open(output_file, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+    done = set()
+    with open(output_file, 'r', newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader, None)  # Skip header
+        for row in reader:
+            if len(row) == len(RELABEL_HEADER):
+                done.add(row[0])
+    return done
+
+
+def _init_relabel_worker(engine_path, max_memory_mb, timeout_match_ms, timeout_turn_ms, samples_per_position):
+    global _worker_solver, _worker_samples
+    _worker_solver = GomokuSolver(
+        engine_path,
+        max_memory_mb=max_memory_mb,
+        timeout_match_ms=timeout_match_ms,
+        timeout_turn_ms=timeout_turn_ms
+    )
+    _worker_samples = samples_per_position
+
+
+def relabel_position(position):
+    """Re-analyze one position on this process's engine and build its output row."""
+    return build_relabel_row(position, sample_position(_worker_solver, position["board_state"], _worker_samples))
+
+
+def build_relabel_row(position, sample_result):
+    """
+    Build an output row holding the old label next to the new one.
+
+    Args:
+        position (dict): Entry from merge_positions
+        sample_result (tuple): Output of generate_self_play_data.sample_position
+
+    Returns:
+        list: Row matching RELABEL_HEADER
+    """
+    majority_move, avg_score_eval, avg_mate_eval, move_counts = sample_result
+    total_votes = sum(move_data["count"] for move_data in move_counts.values())
+    new_confidence = majority_move["count"] / total_votes
+    return [
+        position["position_hash"],
+        str(position["board_state"]),
+        str(position["best_move"]),
+        str(position["score_evaluation"]),
+        str(position["mate_evaluation"]),
+        str(position["confidence"]),
+        str(position["disagreement"]),
+        str(majority_move["move"]),
+        str(avg_score_eval),
+        str(avg_mate_eval),
+        str(move_counts),
+        str(new_confidence),
+        str(tuple(majority_move["move"]) != tuple(position["best_move"])),
+    ]
+
+
+def relabel_dataset(engine_path, input_files, output_file, num_processes=1, max_memory_mb=50, timeout_match_ms=180000, timeout_turn_ms=30000, samples_per_position=8, max_positions=None):
+    """
+    Re-analyze existing dataset positions with a larger engine budget.
+
+    Positions are merged across inputs, ordered so disagreeing and
+    low-confidence labels go first, and fanned out to a pool of engines.
+    Each result is appended to output_file as soon as it arrives, so an
+    interrupted run resumes where it stopped.
+
+    Args:
+        engine_path (str): Path to the engine executable
+        input_files (str or list): TSV (self-play) or JSON/JSON Lines (dataset) files
+        output_file (str): Path to the relabel TSV file
+        num_processes (int): Number of engines analyzing in parallel
+        max_memory_mb (int): Engine memory limit per process
+        timeout_match_ms (int): Engine match time budget
+        timeout_turn_ms (int): Engine time budget per move, usually higher than during self-play
+        samples_per_position (int): Number of engine queries per position
+        max_positions (int): Only relabel this many of the highest-priority positions
+
+    Returns:
+        int: Number of positions relabeled in this run
+    """
+    if isinstance(input_files, str):
+        input_files = [input_files]
+
+    positions = []
+    for input_file in input_files:
+        if input_file.endswith('.tsv'):
+            positions.extend(load_tsv_positions(input_file))
+        else:
+            positions.extend(load_json_positions(input_file))
+    positions = prioritize_positions(merge_positions(positions))
+    if max_positions is not None:
+        positions = positions[:max_positions]
+
+    done = load_done_hashes(output_file)
+    pending = [p for p in positions if p["position_hash"] not in done]
+    print(f"Relabeling {len(pending)} positions ({len(positions) - len(pending)} already done)")
+
+    if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+        with open(output_file, 'w', newline='') as f:
+            writer = csv.writer(f, delimiter='\t')
+            writer.writerow(RELABEL_HEADER)
+
+    init_args = (engine_path, max_memory_mb, timeout_match_ms, timeout_turn_ms, samples_per_position)
+    relabeled = 0
+    with open(output_file, 'a', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        if num_processes > 1:
+            with mp.Pool(num_processes, initializer=_init_relabel_worker, initargs=init_args) as pool:
+                # chunksize=1 keeps dispatch in priority order
+                for row in pool.imap_unordered(relabel_position, pending, chunksize=1):
+                    writer.writerow(row)
+                    f.flush()
+                    relabeled += 1
+        else:
+            _init_relabel_worker(*init_args)
+            for position in pending:
+                writer.writerow(relabel_position(position))
+                f.flush()
+                relabeled += 1
+
+    print(f"Relabeled {relabeled} positions, results saved to {output_file}")
+    return relabeled
+
+
+if __name__ == "__main__":
+    engine_path = os.path.join("engines", "EMBRYO21.E", "pbrain-embryo21_e.exe")
+
+    settings = {
+        "input_files": ["gomoku_data_repeat8.tsv"],
+        "output_file": "gomoku_relabel.tsv",
+        "num_processes": 24,
+        "max_memory_mb_per_process": 80,
+        "timeout_match_ms": 50000000,
+        "timeout_turn_ms": 120000,  # Twice the self-play budget
+        "samples_per_position": 8,
+        "max_positions": None,  # Relabel everything, worst labels first
+    }
+
+    relabel_dataset(
+        engine_path,
+        settings["input_files"],
+        settings["output_file"],
+        num_processes=settings["num_processes"],
+        max_memory_mb=settings["max_memory_mb_per_process"],
+        timeout_match_ms=settings["timeout_match_ms"],
+        timeout_turn_ms=settings["timeout_turn_ms"],
+        samples_per_position=settings["samples_per_position"],
+        max_positions=settings["max_positions"],
+    )
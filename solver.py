@@ -1,3 +1,4 @@
+import os
 import subprocess
 import re
 
@@ -21,6 +22,15 @@ class GomokuSolver:
     def send_command(self, command):
         self.engine_process.stdin.write(command)
         self.engine_process.stdin.flush()
+
+    def close(self, timeout_s=5):
+        """Ask the engine to exit, killing it if it does not stop in time."""
+        try:
+            self.send_command("END\n")
+            self.engine_process.wait(timeout=timeout_s)
+        except (OSError, subprocess.TimeoutExpired):
+            self.engine_process.kill()
+            self.engine_process.wait()
         
     def read_move_response(self):
         # Read all output until we get a line in the format "number,number"
@@ -31,7 +41,10 @@ class GomokuSolver:
         time_ms = None
         
         while True:
-            line = self.engine_process.stdout.readline().strip()
+            line = self.engine_process.stdout.readline()
+            if not line:
+                raise EOFError("engine closed its output before sending a move")
+            line = line.strip()
             all_output.append(line)
 
             if line.startswith("MESSAGE"):
@@ -236,9 +249,9 @@ class GomokuSolver:
                 print('  └' + '───┴' * (self.board_size - 1) + '───┘')
 
 if __name__ == "__main__":
-    generator = GomokuSolver(r"engines\EMBRYO21.E\pbrain-embryo21_e.exe")
-    # generator.generate_data_from_openings_file(r"openings.txt")
-    generator.generate_self_play_data()
+    generator = GomokuSolver(os.path.join("engines", "EMBRYO21.E", "pbrain-embryo21_e.exe"))
+    # Self-play data generation lives in generate_self_play_data.py (or `python gomoku.py selfplay`)
+    generator.generate_data_from_openings_file("openings.txt")
     
     
     # generator = GomokuSolver(r"engines\EMBRYO21.E\pbrain-embryo21_e.exe")